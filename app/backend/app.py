@@ -2,7 +2,7 @@
 import os
 from dotenv import load_dotenv
 from aiohttp import web
-from ragtools import attach_rag_tools_cosmosdb
+from ragtools import attach_rag_tools_cosmosdb_runtime
 from rtmt import RTMiddleTier
 from azure.identity import DefaultAzureCredential
 from azure.core.credentials import AzureKeyCredential
@@ -35,11 +35,9 @@ if __name__ == "__main__":
         "2. Always use the 'report_grounding' tool to report the source of information from the knowledge base. \n"
         "3. Produce an answer that's as short as possible. If the answer isn't in the knowledge base, say you don't know."
     )
-    
-    pdf_dir="../../data"
 
-    # Attach CosmosDB NoSQL database to the real-time middleware.
-    attach_rag_tools_cosmosdb(rtmt, cosmosdb_uri, cosmosdb_key, pdf_dir)
+    # Attach CosmosDB NoSQL database to the real-time middleware. Documents are loaded separately by ingest.py.
+    attach_rag_tools_cosmosdb_runtime(rtmt, cosmosdb_uri, cosmosdb_key)
 
     rtmt.attach_to_app(app, "/realtime")
 
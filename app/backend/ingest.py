@@ -0,0 +1,20 @@
+import os
+import argparse
+from dotenv import load_dotenv
+from ragtools import ingest_pdf_documents
+
+# One-shot ingestion of the PDF knowledge base into Cosmos DB. Run it before starting app.py,
+# and again whenever the documents change; unchanged PDFs are skipped.
+def main():
+    parser = argparse.ArgumentParser(description="Ingest PDF documents into the Azure Cosmos DB vector store.")
+    parser.add_argument("pdf_dir", nargs="?", default="../../data", help="Directory containing the PDF files")
+    args = parser.parse_args()
+
+    load_dotenv()
+    cosmosdb_uri = os.environ.get("COSMOSDB_ACCOUNT_URI")
+    cosmosdb_key = os.environ.get("COSMOSDB_ACCOUNT_KEY")
+
+    ingest_pdf_documents(cosmosdb_uri, cosmosdb_key, args.pdf_dir)
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,50 @@
 from langchain.schema import Document
-import re
 import os
+import hashlib
+import logging
 import uuid
+import httpx
+from typing import Callable
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from cachetools import TTLCache
 from openai import AzureOpenAI
 from dotenv import load_dotenv
 from rtmt import Tool, ToolResult, ToolResultDirection
+from langchain_core.embeddings import Embeddings
 from langchain_openai import AzureOpenAIEmbeddings
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
 from langchain_community.vectorstores.azure_cosmos_db_no_sql import (
     AzureCosmosDBNoSqlVectorSearch,
 )
-from azure.cosmos import CosmosClient
+from azure.cosmos import CosmosClient, ThroughputProperties
+from azure.cosmos.documents import ConnectionPolicy
 from azure.cosmos.partition_key import PartitionKey
+from azure.core.pipeline.transport import RequestsTransport
 from langchain_community.document_loaders import PDFPlumberLoader
-from langchain.text_splitter import CharacterTextSplitter
+from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 # Load environment variables
 load_dotenv(override=True)
 
+logger = logging.getLogger(__name__)
+
+# Minimum cosine similarity for a cached query to be reused as-is
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+
+# Texts per /embeddings request (the Azure OpenAI maximum and the LangChain default), also
+# used as the ingest upload batch size so each uploaded batch is embedded in one request
+EMBEDDINGS_BATCH_SIZE = int(os.getenv("EMBEDDINGS_BATCH_SIZE", 2048))
+
+# Results of recent searches keyed by the exact query text, repeats skip embedding and vector search
+_search_cache = TTLCache(maxsize=1024, ttl=300)
+
+# Grounding source names are chunk titles such as "Benefits (2024).pdf_chunk_0". File names may
+# contain any character and the title lookup is parameterized, so only the length is checked.
+_MAX_SOURCE_LENGTH = 1024
+
 # Search tool schema
 _search_tool_schema = {
     "type": "function",
@@ -58,75 +86,314 @@ _grounding_tool_schema = {
     }
 }
 
-def chunk_text(text, chunk_size=1000):
-    # Split text into chunks of the given size
-    return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
-
-
-def add_pdf_documents(pdf_dir, chunk_size=1000):
-    documents = []
-    for filename in os.listdir(pdf_dir):
-        if filename.endswith(".pdf"):
-            print("Processing File:", filename)
-            filepath = os.path.join(pdf_dir, filename)
-            loader = PDFPlumberLoader(filepath)
-            text_splitter = CharacterTextSplitter(
-                chunk_size=chunk_size, chunk_overlap=250)
-            loaded_documents = loader.load_and_split(text_splitter)
-            
+def quantize_int8(vector):
+    # Scale by the largest component so values fill [-127, 127]. Cosine distance
+    # ignores vector length, so the scale does not need to be kept for queries.
+    max_abs = max((abs(x) for x in vector), default=0.0) or 1.0
+    scale = 127 / max_abs
+    return [max(-127, min(127, round(x * scale))) for x in vector]
+
+def round_float32(vector):
+    # Python floats serialize with up to 17 significant digits but float32 storage keeps about 7,
+    # so trimming them roughly halves the JSON upload with no meaningful change to the stored vector
+    return [float(f"{x:.8g}") for x in vector]
+
+# Embeddings wrapper that shrinks vectors to match the container's vector data type
+class QuantizedEmbeddings(Embeddings):
+    embeddings: Embeddings
+    quantize: Callable[[list[float]], list]
+
+    def __init__(self, embeddings: Embeddings, quantize: Callable[[list[float]], list] = quantize_int8):
+        self.embeddings = embeddings
+        self.quantize = quantize
+
+    def embed_documents(self, texts: list[str]) -> list[list]:
+        return [self.quantize(v) for v in self.embeddings.embed_documents(texts)]
+
+    def embed_query(self, text: str) -> list:
+        return self.quantize(self.embeddings.embed_query(text))
+
+# Text splitter shared by every PDF a worker process handles, set by _init_pdf_worker
+_text_splitter = None
+
+def _init_pdf_worker(chunk_size=512, chunk_overlap=50):
+    # Build the splitter once per process so the tiktoken encoding is loaded once, not per file.
+    # chunk_size and chunk_overlap are measured in tokens.
+    global _text_splitter
+    _text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        encoding_name="cl100k_base",
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", ". ", " ", ""])
+
+def _load_and_split_pdf(path):
+    # Runs in a worker process, so it returns plain picklable tuples
+    filename = os.path.basename(path)
+    print("Processing File:", filename)
+    loader = PDFPlumberLoader(path)
+
+    chunks = []
+    for page in loader.lazy_load():
+        for doc in _text_splitter.split_documents([page]):
+            chunks.append((f"{filename}_chunk_{len(chunks)}", doc.page_content))
+    return chunks
+
+def list_pdf_files(pdf_dir):
+    # scandir entries carry file type info, so no extra stat per name; sorted for a stable ingest order
+    with os.scandir(pdf_dir) as it:
+        pdf_paths = [e.path for e in it if e.is_file() and e.name.lower().endswith(".pdf")]
+    pdf_paths.sort()
+    return pdf_paths
+
+def iter_pdf_documents(paths, chunk_size=512, chunk_overlap=50, file_sha1s=None, empty_paths=None):
+    # Parse PDFs in parallel and yield chunks file by file, in the order given.
+    # At most one parsed file per worker waits to be consumed, so memory stays bounded
+    # even when uploads are slower than parsing.
+    # If file_sha1s (path -> sha1) is passed, each chunk also records its source file, the
+    # file's sha1 and its chunk count, which get_ingested_files reads back from Cosmos DB.
+    # If empty_paths is passed, paths that produced no chunks are appended to it.
+    max_workers = os.cpu_count() or 1
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_pdf_worker,
+        initargs=(chunk_size, chunk_overlap)
+    ) as executor:
+        remaining = iter(paths)
+        pending = deque((path, executor.submit(_load_and_split_pdf, path)) for path in islice(remaining, max_workers))
+        while pending:
+            path, future = pending.popleft()
+            chunks = future.result()
+            next_path = next(remaining, None)
+            if next_path is not None:
+                pending.append((next_path, executor.submit(_load_and_split_pdf, next_path)))
+            if not chunks and empty_paths is not None:
+                empty_paths.append(path)
             # Add metadata to each chunk
-            for i, doc in enumerate(loaded_documents):
-                doc.metadata = {"title": f"{filename}_chunk_{i}"}
-                documents.append(doc)
-                
-    return documents
-
-# Vector search using CosmosDB Vector Store
-def vector_search(query, vector_store):
-    # Perform similarity search on the query
-    docs = vector_store.similarity_search(query)
+            for title, page_content in chunks:
+                metadata = {"title": title}
+                if file_sha1s is not None:
+                    metadata["source"] = os.path.basename(path)
+                    metadata["sha1"] = file_sha1s[path]
+                    metadata["num_chunks"] = len(chunks)
+                yield Document(page_content=page_content, metadata=metadata)
+
+def batch_documents(documents, batch_size=64):
+    # Group an iterable of documents into lists of at most batch_size
+    iterator = iter(documents)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+def ingest_documents(vector_store, documents, batch_size=64):
+    # Upload batch N on a worker thread while batch N+1 is being parsed.
+    # Only one upload is in flight at a time, so peak memory is one batch plus the
+    # parsed files iter_pdf_documents keeps waiting (one per worker).
+    total = 0
+    pending = None
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        for batch in batch_documents(documents, batch_size):
+            if pending is not None:
+                total += len(pending.result())
+            pending = executor.submit(vector_store.add_documents, batch)
+        if pending is not None:
+            total += len(pending.result())
+    return total
+
+def file_sha1(path, block_size=1024 * 1024):
+    # Stream the file so hashing large PDFs uses bounded memory
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def delete_pdf_chunks(container, filename):
+    # Cosmos DB SQL has no DELETE, so look up the chunk ids and delete them one by one.
+    # Chunks from before the source field existed are matched by their title prefix.
+    items = container.query_items(
+        "SELECT c.id FROM c WHERE c.source = @source OR STARTSWITH(c.title, @prefix)",
+        parameters=[
+            {"name": "@source", "value": filename},
+            {"name": "@prefix", "value": f"{filename}_chunk_"}
+        ],
+        enable_cross_partition_query=True)
+    for item in items:
+        container.delete_item(item["id"], partition_key=item["id"])
+
+def record_empty_pdf(container, filename, sha1):
+    # A PDF without extractable text has no chunks to carry its sha1, so store a marker item
+    # instead. It has no title, text or embedding, so grounding never matches it and
+    # vector_search skips it.
+    container.upsert_item({
+        "id": hashlib.sha1(filename.encode("utf-8")).hexdigest(),
+        "source": filename,
+        "sha1": sha1,
+        "num_chunks": 0
+    })
+
+def get_ingested_files(container):
+    # Cosmos DB is the ingest manifest: every chunk records its source file, that file's sha1
+    # and chunk count, so the state survives ephemeral ingest jobs and does not depend on paths.
+    # Returns file name -> sha1, with None for files whose chunks are incomplete, mixed or
+    # predate this metadata, so they get re-ingested.
+    # The aggregate returns one row per file version, so the client reads O(files), not O(chunks).
+    groups = {}
+    rows = container.query_items(
+        "SELECT c.source, c.sha1, c.num_chunks, COUNT(1) AS n FROM c "
+        "WHERE IS_DEFINED(c.source) GROUP BY c.source, c.sha1, c.num_chunks",
+        enable_cross_partition_query=True)
+    for row in rows:
+        groups.setdefault(row["source"], []).append(row)
+    files = {}
+    for source, versions in groups.items():
+        row = versions[0]
+        # An empty PDF is a single marker item with num_chunks 0
+        complete = len(versions) == 1 and row["n"] == max(row["num_chunks"], 1)
+        files[source] = row["sha1"] if complete else None
+
+    # Chunks ingested before the source field existed only have a title
+    titles = container.query_items(
+        "SELECT DISTINCT VALUE c.title FROM c WHERE NOT IS_DEFINED(c.source)",
+        enable_cross_partition_query=True)
+    for title in titles:
+        files[title.rsplit("_chunk_", 1)[0]] = None
+    return files
+
+def sync_pdf_documents(vector_store, container, pdf_dir, chunk_size=512, chunk_overlap=50, batch_size=64):
+    # Ingest only PDFs that are new or changed compared to what the container already holds.
+    # Returns the number of chunks uploaded and the number of files added, changed or removed.
+    pdf_paths = {os.path.basename(path): path for path in list_pdf_files(pdf_dir)}
+    if not pdf_paths:
+        # Most likely a wrong or unmounted pdf_dir, so keep the knowledge base as it is
+        print(f"No PDFs found in '{pdf_dir}', skipping ingestion")
+        return 0, 0
+    ingested = get_ingested_files(container)
+
+    # Remove chunks of files that are no longer in pdf_dir
+    removed = [filename for filename in ingested if filename not in pdf_paths]
+    for filename in removed:
+        print("Removing File:", filename)
+        delete_pdf_chunks(container, filename)
+
+    changed = {}
+    for filename, path in pdf_paths.items():
+        sha1 = file_sha1(path)
+        if filename in ingested:
+            if ingested[filename] == sha1:
+                continue
+            # Clear chunks left by an earlier version or an interrupted run
+            delete_pdf_chunks(container, filename)
+        changed[path] = sha1
+
+    if not changed:
+        return 0, len(removed)
+
+    empty_paths = []
+    documents = iter_pdf_documents(list(changed), chunk_size, chunk_overlap, changed, empty_paths)
+    documents_count = ingest_documents(vector_store, documents, batch_size)
+    for path in empty_paths:
+        record_empty_pdf(container, os.path.basename(path), changed[path])
+    return documents_count, len(removed) + len(changed)
+
+# Vector search over the knowledge base container with an already embedded query
+def vector_search(query_vector, container, k=4):
+    items = container.query_items(
+        "SELECT TOP @k c.title, c.text FROM c ORDER BY VectorDistance(c.embedding, @embedding)",
+        parameters=[
+            {"name": "@k", "value": k},
+            {"name": "@embedding", "value": query_vector}
+        ],
+        enable_cross_partition_query=True)
+    # The vector store flattens document metadata into the item, so the title is c.title
+    docs = []
+    for item in items:
+        if "text" not in item:
+            # Empty PDF marker from record_empty_pdf, it has no embedding and sorts last
+            continue
+        metadata = {"title": item["title"]} if "title" in item else {}
+        docs.append(Document(page_content=item["text"], metadata=metadata))
     return docs
 
-def _search_tool(vector_store, args):
+# Semantic cache of formatted search results, keyed by query embedding
+def semantic_cache_lookup(cache_container, query_vector, threshold=SEMANTIC_CACHE_THRESHOLD):
+    items = cache_container.query_items(
+        "SELECT TOP 1 c.result_str, VectorDistance(c.embedding, @embedding) AS SimilarityScore "
+        "FROM c ORDER BY VectorDistance(c.embedding, @embedding)",
+        parameters=[{"name": "@embedding", "value": query_vector}],
+        enable_cross_partition_query=True)
+    for item in items:
+        if item["SimilarityScore"] >= threshold:
+            return item["result_str"]
+    return None
+
+def clear_semantic_cache(cache_container):
+    # Cached results may quote chunks that were just replaced or deleted. Cosmos DB SQL has no
+    # DELETE, and items expire after SEMANTIC_CACHE_TTL anyway, so the cache stays small.
+    items = cache_container.query_items("SELECT c.id FROM c", enable_cross_partition_query=True)
+    for item in items:
+        cache_container.delete_item(item["id"], partition_key=item["id"])
+
+def semantic_cache_store(cache_container, query, query_vector, result_str):
+    cache_container.upsert_item({
+        "id": str(uuid.uuid4()),
+        "query": query,
+        "embedding": query_vector,
+        "result_str": result_str
+    })
+
+def _search_tool(container, embeddings, cache_container, args):
     query = args['query']
     print(f"Searching for '{query}' in the knowledge base.")
 
-    # Perform vector search using CosmosDB vector store
-    results = vector_search(query, vector_store)
+    cached_result = _search_cache.get(query)
+    if cached_result is not None:
+        print("Search cache hit.")
+        return ToolResult(cached_result, ToolResultDirection.TO_SERVER)
+
+    # Reuse the answer to a semantically identical earlier query if there is one
+    query_vector = embeddings.embed_query(query)
+    cached_result = semantic_cache_lookup(cache_container, query_vector)
+    if cached_result is not None:
+        print("Semantic cache hit.")
+        _search_cache[query] = cached_result
+        return ToolResult(cached_result, ToolResultDirection.TO_SERVER)
+
+    # Perform vector search using the same query embedding, so a cache miss costs one embedding call
+    results = vector_search(query_vector, container)
     
     # Format results to be sent as a system message to the LLM
-    result_str = ""
+    parts = []
     for i, doc in enumerate(results):
         truncated_content = doc.page_content[:2000] if len(doc.page_content) > 2000 else doc.page_content
-        print(truncated_content)
-        result_str += f"[doc_{i}]: Content: {truncated_content}\n-----\n"
+        logger.debug(truncated_content)
+        title = doc.metadata.get("title", f"doc_{i}")
+        parts.append(f"[{title}]: Content: {truncated_content}\n-----\n")
+    result_str = "".join(parts)
     if not result_str or result_str.isspace():
         result_str = "1"
+    else:
+        semantic_cache_store(cache_container, query, query_vector, result_str)
+        _search_cache[query] = result_str
     
     return ToolResult(result_str, ToolResultDirection.TO_SERVER)
 
-def _report_grounding_tool(vector_store, args):
+def _report_grounding_tool(container, args):
     sources = args["sources"]
-    valid_sources = [s for s in sources if re.match(r'^[a-zA-Z0-9_=\-]+$', s)]
+    valid_sources = [s for s in sources if isinstance(s, str) and 0 < len(s) <= _MAX_SOURCE_LENGTH]
     list_of_sources = " OR ".join(valid_sources)
     print(f"Grounding source: {list_of_sources}")
 
-    # Fetch documents from the vector store using the search functionality
+    # Fetch the cited chunks by title in a single indexed query
     search_results = []
-
-    for source in valid_sources:
-        # Perform a vector search using the title as the query
-        docs = vector_store.similarity_search(source)
-        for doc in docs:
-            search_results.append({
-                "content": doc.page_content,
-                "metadata": doc
-            })
+    if valid_sources:
+        search_results = container.query_items(
+            "SELECT c.text FROM c WHERE ARRAY_CONTAINS(@titles, c.title)",
+            parameters=[{"name": "@titles", "value": valid_sources}],
+            enable_cross_partition_query=True)
 
     # Format the results
     result_str = ""
     for result in search_results:
-        result_str += f"[{result['content'][:200]}...\n-----\n"
+        result_str += f"[{result['text'][:200]}...\n-----\n"
     
     if not result_str or result_str.isspace():
         result_str = "1"
@@ -142,73 +409,79 @@ def check_vector_store_empty(vector_store):
 
 # Initialize CosmosDB client
 def init_cosmosdb_client(cosmsodb_uri, cosmosdb_key):
-    return CosmosClient(url=cosmsodb_uri, credential=cosmosdb_key)
+    # Fail fast on a stalled request rather than holding up a voice turn. RequestTimeout only
+    # bounds connecting (60s by default); reading the response is bounded by the transport,
+    # whose read timeout defaults to 300s, so both are set.
+    request_timeout = int(os.getenv("COSMOSDB_REQUEST_TIMEOUT", 5))
+    connection_policy = ConnectionPolicy()
+    connection_policy.RequestTimeout = request_timeout
+    return CosmosClient(
+        url=cosmsodb_uri,
+        credential=cosmosdb_key,
+        connection_policy=connection_policy,
+        consistency_level="Session",
+        transport=RequestsTransport(read_timeout=request_timeout)
+    )
+
+def get_vector_index(path, index_type):
+    vectorIndex = {"path": path, "type": f"{index_type}"}
+    if index_type == "diskANN":
+        # Compressed vectors kept in memory, and candidates visited per search
+        vectorIndex["quantizationByteSize"] = 96
+        vectorIndex["indexingSearchListSize"] = 100
+    return vectorIndex
 
 def get_vector_indexing_policy(embedding_path, embedding_type):
-    for i in range(0, len(embedding_type)):
-        vectorIndexes = []
-        vectorIndex = {"path": embedding_path[0], "type": f"{embedding_type[0]}"}
-        vectorIndexes.append(vectorIndex)
-        
+    vectorIndexes = [get_vector_index(p, t) for p, t in zip(embedding_path, embedding_type)]
+
+    # Vector paths are served by the vector index only, range-indexing them just adds write RUs
     return {
         "indexingMode": "consistent",
         "includedPaths": [{"path": "/*"}],
-        'excludedPaths': [{'path': '/"_etag"/?'}],
+        'excludedPaths': [{'path': '/"_etag"/?'}] + [{'path': f"{path}/*"} for path in embedding_path],
         "vectorIndexes": vectorIndexes
     }
 
 def get_vector_embedding_policy(embedding_path, distance_function, data_type, dimensions):
-    for i in range(0, len(distance_function)):
-        vectorEmbeddings = []
-        vectorEmbedding = {
-                    "path": embedding_path[0],
-                    "dataType": f"{data_type[0]}",
-                    "dimensions": dimensions[0],
-                    "distanceFunction": f"{distance_function[0]}"
-                }
-        vectorEmbeddings.append(vectorEmbedding)
-        
+    vectorEmbeddings = [
+        {
+            "path": p,
+            "dataType": f"{dt}",
+            "dimensions": dim,
+            "distanceFunction": f"{df}"
+        }
+        for p, dt, dim, df in zip(embedding_path, data_type, dimensions, distance_function)
+    ]
+
     return {
         "vectorEmbeddings": vectorEmbeddings
     }
 
 # Check and create Cosmos DB Database and Container
-def check_and_create_cosmosdb_database_container(cosmos_client, database_name, container_name, indexing_policy, vector_embedding_policy):
+def check_and_create_cosmosdb_database_container(cosmos_client, database_name, container_name, indexing_policy, vector_embedding_policy, default_ttl=None, offer_throughput=30000):
     database = cosmos_client.create_database_if_not_exists(database_name)
     print('Database with id \'{0}\' created'.format(database_name))
     
     container = database.create_container_if_not_exists(
         id=container_name,
         partition_key=PartitionKey(path="/id"),
-        offer_throughput=30000,
+        offer_throughput=offer_throughput,
         indexing_policy=indexing_policy,
-        vector_embedding_policy=vector_embedding_policy
+        vector_embedding_policy=vector_embedding_policy,
+        default_ttl=default_ttl
     )
 
     return container
 
-def attach_rag_tools_cosmosdb(rtmt, cosmosdb_uri, cosmosdb_key, pdf_dir):
-    
-    cosmos_client = init_cosmosdb_client(cosmosdb_uri, cosmosdb_key)
-    
-    azure_openai_embeddings = AzureOpenAIEmbeddings(
-        azure_deployment= os.getenv("AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT_NAME"),
-        api_key = os.getenv("AZURE_OPENAI_API_KEY"),
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-        model=os.getenv("AZURE_OPENAI_EMBEDDINGS_MODEL_NAME")
-    )
+# Vector data type and index type of the knowledge base container
+def get_cosmosdb_vector_data_type():
+    return os.getenv("COSMOSDB_VECTOR_DATA_TYPE") or "int8"
 
-    cosmosdb_databse = os.getenv("COSMOSDB_DATABASE")
-    cosmosdb_container = os.getenv("COSMOSDB_CONTAINER")
-   
-    cosmos_db_vector_embedding_type = os.getenv("COSMOSDB_VECTOR_EMBEDDINGS_TYPE")
+def get_cosmosdb_vector_policies():
+    cosmos_db_vector_embedding_type = os.getenv("COSMOSDB_VECTOR_EMBEDDINGS_TYPE") or "diskANN"
 
-    # cosmosdb_container= "diskann3"
     # cosmos_db_vector_embedding_type="diskANN"
     # cosmos_db_vector_embedding_type="quantizedFlat"
-    
-    partition_key = PartitionKey(path="/id")
-    cosmos_container_properties = {"partition_key": partition_key}
 
     indexing_policy=get_vector_indexing_policy(
         embedding_path=["/embedding"],
@@ -217,18 +490,50 @@ def attach_rag_tools_cosmosdb(rtmt, cosmosdb_uri, cosmosdb_key, pdf_dir):
     vector_embedding_policy=get_vector_embedding_policy(
         embedding_path=["/embedding"],
         distance_function=["cosine"],
-        data_type=["float32"],
+        data_type=[get_cosmosdb_vector_data_type()],
         dimensions=[1536]
         )
-    
-    check_and_create_cosmosdb_database_container(cosmos_client, cosmosdb_databse, cosmosdb_container, indexing_policy, vector_embedding_policy)
+    return indexing_policy, vector_embedding_policy
+
+def init_embeddings(cache_documents=False):
+    embeddings = AzureOpenAIEmbeddings(
+        azure_deployment= os.getenv("AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT_NAME"),
+        api_key = os.getenv("AZURE_OPENAI_API_KEY"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        model=os.getenv("AZURE_OPENAI_EMBEDDINGS_MODEL_NAME"),
+        chunk_size=EMBEDDINGS_BATCH_SIZE,
+        max_retries=6,
+        # Shared HTTP/2 connection pool so tool calls reuse warm connections instead of new TLS handshakes
+        http_client=httpx.Client(http2=True, limits=httpx.Limits(max_keepalive_connections=32))
+    )
+
+    if cache_documents:
+        # Memoize document vectors on disk so re-ingesting unchanged chunks costs a hash, not an API call
+        embeddings = CacheBackedEmbeddings.from_bytes_store(
+            embeddings,
+            LocalFileStore(os.getenv("EMBEDDINGS_CACHE_DIR", "./.emb_cache")),
+            namespace=os.getenv("AZURE_OPENAI_EMBEDDINGS_MODEL_NAME") or ""
+        )
 
-    documents = add_pdf_documents(pdf_dir)
-    print("Documents", len(documents))
+    # int8 vectors are a quarter of the size of float32 ones, both on the wire and in the index
+    return QuantizedEmbeddings(
+        embeddings,
+        quantize_int8 if get_cosmosdb_vector_data_type() == "int8" else round_float32
+    )
+
+def init_cosmosdb_vector_store(cosmos_client, embeddings):
+    cosmosdb_databse = os.getenv("COSMOSDB_DATABASE")
+    cosmosdb_container = os.getenv("COSMOSDB_CONTAINER")
+
+    partition_key = PartitionKey(path="/id")
+    cosmos_container_properties = {"partition_key": partition_key}
+
+    indexing_policy, vector_embedding_policy = get_cosmosdb_vector_policies()
 
-    vector_store = AzureCosmosDBNoSqlVectorSearch.from_documents(
-        documents=documents,
-        embedding=azure_openai_embeddings,
+    container = check_and_create_cosmosdb_database_container(cosmos_client, cosmosdb_databse, cosmosdb_container, indexing_policy, vector_embedding_policy)
+
+    vector_store = AzureCosmosDBNoSqlVectorSearch(
+        embedding=embeddings,
         cosmos_client=cosmos_client,
         database_name=cosmosdb_databse,
         container_name=cosmosdb_container,
@@ -240,14 +545,66 @@ def attach_rag_tools_cosmosdb(rtmt, cosmosdb_uri, cosmosdb_key, pdf_dir):
         cosmos_container_properties=cosmos_container_properties,
     )
 
+    return container, vector_store
+
+def init_query_cache_container(cosmos_client):
+    # Cached search results expire so answers follow re-ingested documents
+    indexing_policy, vector_embedding_policy = get_cosmosdb_vector_policies()
+    return check_and_create_cosmosdb_database_container(
+        cosmos_client,
+        os.getenv("COSMOSDB_DATABASE"),
+        os.getenv("COSMOSDB_QUERY_CACHE_CONTAINER", "query_cache"),
+        indexing_policy,
+        vector_embedding_policy,
+        default_ttl=int(os.getenv("SEMANTIC_CACHE_TTL", 86400)),
+        # Small autoscale container, it scales down to 10% of the maximum when idle
+        offer_throughput=ThroughputProperties(
+            auto_scale_max_throughput=int(os.getenv("SEMANTIC_CACHE_MAX_THROUGHPUT", 1000)))
+    )
+
+# Ingest PDFs into the knowledge base, run once per corpus version by ingest.py
+def ingest_pdf_documents(cosmosdb_uri, cosmosdb_key, pdf_dir):
+    cosmos_client = init_cosmosdb_client(cosmosdb_uri, cosmosdb_key)
+    container, vector_store = init_cosmosdb_vector_store(cosmos_client, init_embeddings(cache_documents=True))
+    query_cache_container = init_query_cache_container(cosmos_client)
+
+    # Only new or changed PDFs are parsed and embedded
+    documents_count, changed_files = sync_pdf_documents(
+        vector_store,
+        container,
+        pdf_dir,
+        chunk_size=int(os.getenv("CHUNK_SIZE", 512)),
+        chunk_overlap=int(os.getenv("CHUNK_OVERLAP", 50)),
+        batch_size=EMBEDDINGS_BATCH_SIZE
+    )
+    print("Documents", documents_count)
+
+    # Drop cached search results that may quote replaced or deleted chunks
+    if changed_files:
+        print("Clearing the semantic cache")
+        clear_semantic_cache(query_cache_container)
+    return documents_count
+
+# Attach search and grounding tools over an already ingested knowledge base
+def attach_rag_tools_cosmosdb_runtime(rtmt, cosmosdb_uri, cosmosdb_key):
+    cosmos_client = init_cosmosdb_client(cosmosdb_uri, cosmosdb_key)
+    # Queries are embedded once per search, so the on-disk document cache would only add file I/O
+    embeddings = init_embeddings()
+
+    # ingest.py provisions the database and containers, the web tier only needs clients for them
+    database = cosmos_client.get_database_client(os.getenv("COSMOSDB_DATABASE"))
+    container = database.get_container_client(os.getenv("COSMOSDB_CONTAINER"))
+    query_cache_container = database.get_container_client(
+        os.getenv("COSMOSDB_QUERY_CACHE_CONTAINER", "query_cache"))
+
     # Attach search and grounding tools
     rtmt.tools["search"] = Tool(
         schema=_search_tool_schema,
-        target=lambda args: _search_tool(vector_store, args)
+        target=lambda args: _search_tool(container, embeddings, query_cache_container, args)
     )
     rtmt.tools["report_grounding"] = Tool(
         schema=_grounding_tool_schema,
-        target=lambda args: _report_grounding_tool(vector_store, args)
+        target=lambda args: _report_grounding_tool(container, args)
     )
 
 # generate openai embeddings
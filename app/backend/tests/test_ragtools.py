@@ -0,0 +1,141 @@
+import re
+from collections import Counter
+import ragtools
+from ragtools import (
+    _report_grounding_tool,
+    _search_tool,
+    get_ingested_files,
+    get_vector_embedding_policy,
+    get_vector_indexing_policy,
+    quantize_int8,
+)
+
+# Items as langchain-community's AzureCosmosDBNoSqlVectorSearch stores them: metadata is flattened
+ITEMS = [
+    {"id": "1", "text": "Dental coverage details", "embedding": [1, 0], "title": "Benefits.pdf_chunk_0"},
+    {"id": "2", "text": "Vision coverage details", "embedding": [0, 1], "title": "Benefits.pdf_chunk_1"},
+    {"id": "3", "text": "Travel policy details", "embedding": [0, 1], "title": "Travel Policy (2024).pdf_chunk_0"},
+]
+
+class FakeContainer:
+    def __init__(self, items):
+        self.items = items
+        self.upserted = []
+
+    def query_items(self, query, parameters=None, enable_cross_partition_query=None):
+        params = {p["name"]: p["value"] for p in parameters or []}
+        if "GROUP BY" in query:
+            # Ingest manifest aggregate, one row per source, sha1 and chunk count
+            counts = Counter((i["source"], i["sha1"], i["num_chunks"]) for i in self.items if "source" in i)
+            return iter([{"source": k[0], "sha1": k[1], "num_chunks": k[2], "n": n} for k, n in counts.items()])
+        if "DISTINCT VALUE c.title" in query:
+            return iter({i["title"] for i in self.items if "source" not in i})
+        fields = re.match(r"SELECT (?:TOP @k )?(.+?) FROM c", query).group(1)
+        if "VectorDistance" in fields:
+            # Semantic cache lookup, always a miss
+            return iter([])
+        items = self.items
+        contains = re.search(r"ARRAY_CONTAINS\(@titles, c\.(\w+)\)", query)
+        if "ARRAY_CONTAINS" in query:
+            field = contains.group(1) if contains else None
+            items = [i for i in items if field and i.get(field) in params["@titles"]]
+        if "@k" in params:
+            items = items[:params["@k"]]
+        names = [f.strip()[2:] for f in fields.split(",")]
+        return iter([{n: i[n] for n in names if n in i} for i in items])
+
+    def upsert_item(self, item):
+        self.upserted.append(item)
+
+class FakeCacheContainer:
+    # Semantic cache holding one result that is close enough to any query
+    def __init__(self, result_str, score=0.99):
+        self.item = {"result_str": result_str, "SimilarityScore": score}
+
+    def query_items(self, query, parameters=None, enable_cross_partition_query=None):
+        return iter([self.item])
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.queries = []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [1, 0]
+
+def test_search_labels_results_with_chunk_titles():
+    ragtools._search_cache.clear()
+    result = _search_tool(FakeContainer(ITEMS), FakeEmbeddings(), FakeContainer([]), {"query": "dental plan"})
+
+    assert "[Benefits.pdf_chunk_0]: Content: Dental coverage details" in result.text
+    assert "[Benefits.pdf_chunk_1]: Content: Vision coverage details" in result.text
+
+def test_search_returns_semantic_cache_hit():
+    ragtools._search_cache.clear()
+    cached = "[Benefits.pdf_chunk_0]: Content: Cached dental answer\n-----\n"
+
+    result = _search_tool(FakeContainer(ITEMS), FakeEmbeddings(), FakeCacheContainer(cached), {"query": "dental"})
+
+    assert result.text == cached
+    assert ragtools._search_cache["dental"] == cached
+
+def test_repeated_search_is_served_from_ttl_cache_without_embedding():
+    ragtools._search_cache.clear()
+    embeddings = FakeEmbeddings()
+    cache_container = FakeContainer([])
+
+    first = _search_tool(FakeContainer(ITEMS), embeddings, cache_container, {"query": "vision plan"})
+    second = _search_tool(FakeContainer(ITEMS), embeddings, cache_container, {"query": "vision plan"})
+
+    assert second.text == first.text
+    assert embeddings.queries == ["vision plan"]
+    assert len(cache_container.upserted) == 1
+
+def test_grounding_fetches_cited_chunks_by_title():
+    sources = ["Benefits.pdf_chunk_1", "Travel Policy (2024).pdf_chunk_0", "", "x" * 2000]
+    result = _report_grounding_tool(FakeContainer(ITEMS), {"sources": sources})
+
+    assert "Vision coverage details" in result.text
+    assert "Travel policy details" in result.text
+    assert "Dental coverage details" not in result.text
+
+def test_ingested_files_are_read_back_from_chunk_metadata():
+    items = [
+        # Complete file
+        {"title": "a.pdf_chunk_0", "source": "a.pdf", "sha1": "aaa", "num_chunks": 2},
+        {"title": "a.pdf_chunk_1", "source": "a.pdf", "sha1": "aaa", "num_chunks": 2},
+        # Interrupted upload, one of two chunks stored
+        {"title": "b.pdf_chunk_0", "source": "b.pdf", "sha1": "bbb", "num_chunks": 2},
+        # Ingested before chunks recorded their source file
+        {"title": "c.pdf_chunk_0"},
+        {"title": "c.pdf_chunk_1"},
+        # PDF without text, recorded by a marker item
+        {"id": "d", "source": "d.pdf", "sha1": "ddd", "num_chunks": 0},
+        # Chunks of two versions of the same file
+        {"title": "e.pdf_chunk_0", "source": "e.pdf", "sha1": "old", "num_chunks": 1},
+        {"title": "e.pdf_chunk_0", "source": "e.pdf", "sha1": "new", "num_chunks": 1},
+    ]
+
+    assert get_ingested_files(FakeContainer(items)) == {
+        "a.pdf": "aaa", "b.pdf": None, "c.pdf": None, "d.pdf": "ddd", "e.pdf": None}
+
+def test_policies_register_every_vector_path():
+    paths = ["/embedding", "/title_embedding"]
+    indexing_policy = get_vector_indexing_policy(paths, ["diskANN", "quantizedFlat"])
+    embedding_policy = get_vector_embedding_policy(paths, ["cosine", "dotproduct"], ["int8", "float32"], [1536, 256])
+
+    assert [(i["path"], i["type"]) for i in indexing_policy["vectorIndexes"]] == [
+        ("/embedding", "diskANN"), ("/title_embedding", "quantizedFlat")]
+    assert indexing_policy["vectorIndexes"][0]["quantizationByteSize"] == 96
+    assert "quantizationByteSize" not in indexing_policy["vectorIndexes"][1]
+    assert {"path": "/embedding/*"} in indexing_policy["excludedPaths"]
+    assert {"path": "/title_embedding/*"} in indexing_policy["excludedPaths"]
+    assert embedding_policy["vectorEmbeddings"] == [
+        {"path": "/embedding", "dataType": "int8", "dimensions": 1536, "distanceFunction": "cosine"},
+        {"path": "/title_embedding", "dataType": "float32", "dimensions": 256, "distanceFunction": "dotproduct"},
+    ]
+
+def test_quantize_int8_scales_to_the_largest_component():
+    assert quantize_int8([1.0, 0.3, -0.6]) == [127, 38, -76]
+    assert quantize_int8([-2.0, 0.5]) == [-127, 32]
+    assert quantize_int8([0.0, 0.0]) == [0, 0]
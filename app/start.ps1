@@ -27,6 +27,15 @@ if ($LASTEXITCODE -ne 0) {
     exit $LASTEXITCODE
 }
 
+Write-Host ""
+Write-Host "Ingesting documents"
+Write-Host ""
+python ingest.py
+if ($LASTEXITCODE -ne 0) {
+    Write-Host "Failed to ingest documents"
+    exit $LASTEXITCODE
+}
+
 Write-Host ""
 Write-Host "Starting backend"
 Write-Host ""
@@ -29,6 +29,15 @@ if [ $? -ne 0 ]; then
     exit $?
 fi
 
+echo ""
+echo "Ingesting documents"
+echo ""
+python ingest.py
+if [ $? -ne 0 ]; then
+    echo "Failed to ingest documents"
+    exit $?
+fi
+
 echo ""
 echo "Starting backend"
 echo ""